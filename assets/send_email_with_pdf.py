@@ -7,14 +7,10 @@ QQ 邮箱附件发送脚本
 
 import os
 import sys
-import smtplib
-import shutil
 import time
-from pathlib import Path
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from datetime import datetime
+from collections import Counter
+
+# smtplib、email、zipfile 等较重的模块在使用处按需导入，邮箱未配置直接跳过时无需加载
 
 # ============================================
 # 配置区域
@@ -22,8 +18,16 @@ from datetime import datetime
 SMTP_HOST = 'smtp.qq.com'
 SMTP_PORT = 465
 ATTACH_LIMIT_MB = 50  # QQ 邮箱附件大小限制（MB）
+ATTACH_LIMIT_BYTES = ATTACH_LIMIT_MB * 1024 * 1024  # 仅用于比较，按整数字节判断是否超限
 MAX_RETRIES = 1  # 发送失败重试次数
-RETRY_DELAY = 3  # 重试间隔（秒）
+RETRY_DELAY = 3  # 重试基础间隔（秒），按指数递增
+RETRY_MAX_DELAY = 30  # 重试间隔上限（秒）
+RETRY_JITTER = 0.5  # 重试间隔随机抖动比例
+SCAN_WORKERS = 8  # 并行扫描子目录的线程数
+PDF_EXTENSIONS = frozenset(('pdf',))  # 扩展名均为小写、不含点
+IMAGE_EXTENSIONS = frozenset(('jpg', 'jpeg', 'png', 'webp'))
+SEP = '=' * 50 + '\n'  # 邮件正文分隔线
+ATTACH_CHUNK_SIZE = 57 * 1024  # 附件分块编码大小，57 的倍数可保证 base64 每行 76 字符对齐
 
 # ============================================
 # 从环境变量读取配置
@@ -36,246 +40,595 @@ EMAIL_TITLE = os.getenv('EMAIL_TITLE', '')
 EMAIL_CONTENT = os.getenv('EMAIL_CONTENT', '')
 OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'pdf_only')  # 输出模式：pdf_only / images_only
 ZIP_NAME = os.getenv('ZIP_NAME', '本子.tar.gz')  # workflow 压缩包名
+ZIP_COMPRESSION = os.getenv('ZIP_COMPRESSION', 'stored')  # PDF 打包方式：stored（仅存储）/ deflate（多线程压缩）
+# deflate 打包时的压缩级别（1-9），PDF 压缩收益很小，默认取最快的 1；
+# 在模块加载时解析，非法值回退为 1 而不是让脚本在 main 的异常保护之外直接崩溃
+try:
+    ZIP_DEFLATE_LEVEL = min(9, max(1, int(os.getenv('ZIP_DEFLATE_LEVEL', '1'))))
+except ValueError:
+    ZIP_DEFLATE_LEVEL = 1
+
+# 由下载目录派生的路径，只在加载时拼接一次
+PDF_DIR = os.path.join(JM_DOWNLOAD_DIR, 'pdf')
+PDF_ZIP_NAME = 'all_pdf.zip'
+PDF_ZIP_PATH = os.path.join(JM_DOWNLOAD_DIR, PDF_ZIP_NAME)
+ARCHIVE_PATH = os.path.join(JM_DOWNLOAD_DIR, ZIP_NAME)
+
+# 本次运行内复用的 SMTP 连接，避免每封邮件都重新握手与登录
+_smtp_conn = None
 
 
 def log(message, level='INFO'):
-    timestamp = datetime.now().strftime('%H:%M:%S')
-    print(f"[{timestamp}] [{level}] {message}")
+    print(f"[{time.strftime('%H:%M:%S')}] [{level}] {message}")
+
+
+def log_lines(lines, level='INFO'):
+    """多行日志共用同一时间戳，一次性写出，避免逐行 print"""
+    prefix = f"[{time.strftime('%H:%M:%S')}] [{level}] "
+    sys.stdout.write(''.join(f"{prefix}{line}\n" for line in lines))
+
+
+def bytes_to_mb(size_bytes):
+    """仅用于展示，返回保留一位小数的 MB 字符串；大小比较一律直接用字节数"""
+    # 以 0.1 MB 为单位四舍五入，纯整数移位运算，不经过浮点除法与 round
+    whole, tenth = divmod((size_bytes * 10 + (1 << 19)) >> 20, 10)
+    return f"{whole}.{tenth}"
 
 
-def get_file_size_mb(file_path):
-    size_bytes = os.path.getsize(file_path)
-    return round(size_bytes / (1024 * 1024), 1)
+def ext_matches(name, exts):
+    """按文件名后缀（不含点、忽略大小写）匹配，纯字符串操作，不构造 Path"""
+    dot = name.rfind('.')
+    return dot != -1 and name[dot + 1:].lower() in exts
+
+
+def file_entry_info(entry):
+    # 每个文件一次 lstat（Linux 的 getdents 不带文件大小），结果缓存在 DirEntry 上，之后不会再次 stat
+    size_bytes = entry.stat(follow_symlinks=False).st_size
+    return {
+        'path': entry.path,
+        'name': entry.name,
+        'size_bytes': size_bytes,
+        'size_mb': bytes_to_mb(size_bytes)
+    }
+
+
+def iter_files(root, exts):
+    """以 os.scandir 单次递归遍历 root，逐个产出匹配扩展名的文件 DirEntry，跳过符号链接"""
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        # 与 Path.rglob 一致，不存在、无权限或遍历期间被删除的目录直接跳过，不让整次扫描失败；
+        # 直接打开目录，由异常判断，省去一次单独的 isdir 检查
+        try:
+            it = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            log(f"目录不存在: {path}", 'WARNING')
+            continue
+        except OSError as e:
+            log(f"⚠️ 无法读取目录，已跳过: {path} ({e})", 'WARNING')
+            continue
+        with it:
+            for entry in it:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif ext_matches(entry.name, exts):
+                    yield entry
 
 
 def scan_files(base_dir, file_extensions):
-    """扫描指定扩展名的文件并返回文件信息列表"""
-    base_path = Path(base_dir)
-    if not base_path.exists():
-        log(f"目录不存在: {base_dir}", 'WARNING')
-        return []
-
-    file_info = []
-    for ext in file_extensions:
-        files = sorted(base_path.rglob(f'*.{ext}'))
-        for file in files:
-            size_mb = get_file_size_mb(file)
-            file_info.append({
-                'path': str(file),
-                'name': file.name,
-                'size_mb': size_mb
-            })
-    return file_info
+    """扫描指定扩展名（小写、不含点的 frozenset）的文件，返回 (文件信息列表, 总字节数)"""
+    # 根目录不存在或无法读取时由 iter_files 记录警告，结果为空；PDF 目录通常是平铺的，单线程遍历即可
+    file_info = [file_entry_info(entry) for entry in iter_files(base_dir, file_extensions)]
+    file_info.sort(key=lambda x: x['path'])
+    return file_info, sum(info['size_bytes'] for info in file_info)
 
 
 def scan_pdf_files(pdf_dir):
-    return scan_files(pdf_dir, ['pdf'])
+    return scan_files(pdf_dir, PDF_EXTENSIONS)
+
+
+def zip_arcname(file_info):
+    """ZIP 内保留相对 PDF 目录的路径（与原 make_archive 一致），避免不同子目录下的同名文件相互覆盖"""
+    return os.path.relpath(file_info['path'], PDF_DIR).replace(os.sep, '/')
+
+
+def deflate_file(file_path):
+    """读取并以 raw deflate 压缩单个文件，返回 (压缩数据, crc32, 原始大小, 修改时间)"""
+    import zlib
+
+    with open(file_path, 'rb') as f:
+        # 修改时间直接取自已打开的文件句柄，不再按路径单独 stat
+        mtime = os.fstat(f.fileno()).st_mtime
+        data = f.read()
+    compressor = zlib.compressobj(ZIP_DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data), len(data), mtime
+
+
+def dos_date_time(timestamp):
+    t = time.localtime(timestamp)
+    date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    clock = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return date, clock
+
+
+def write_deflate_zip(pdf_files, output_path):
+    """
+    多线程并行 deflate 各文件（zlib 压缩时会释放 GIL），
+    再按 ZIP 格式顺序写入本地文件头、压缩数据、中央目录与目录结束记录
+    """
+    import struct
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    def write_zip64():
+        # 超出普通 ZIP 格式上限时交给 zipfile 处理 ZIP64
+        with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=ZIP_DEFLATE_LEVEL, allowZip64=True) as zf:
+            for file_info in pdf_files:
+                zf.write(file_info['path'], arcname=zip_arcname(file_info))
+
+    def write_parallel():
+        """返回 False 表示继续写入会使偏移量超出普通 ZIP 格式上限，需改用 ZIP64"""
+        workers = os.cpu_count() or 1
+        central_dir = []
+        cd_size = 0
+        with open(output_path, 'wb') as out, ThreadPoolExecutor(max_workers=workers) as executor:
+            # 按批提交，内存中最多同时保留一批文件的数据
+            for i in range(0, len(pdf_files), workers):
+                batch = pdf_files[i:i + workers]
+                results = executor.map(deflate_file, [file_info['path'] for file_info in batch])
+                for file_info, (data, crc, size, mtime) in zip(batch, results):
+                    name = zip_arcname(file_info).encode('utf-8')
+                    offset = out.tell()
+                    # deflate 已压缩的数据可能略有膨胀，原始总大小未超限不代表实际偏移不超限；
+                    # 按实际位置计入本地文件头（30）、数据、全部中央目录记录（46 + 文件名）与目录结束记录（22）
+                    if offset + 30 + len(name) + len(data) + cd_size + 46 + len(name) + 22 >= zipfile.ZIP64_LIMIT:
+                        return False
+                    date, clock = dos_date_time(mtime)
+                    # 0x800: 文件名使用 UTF-8 编码；8: deflate
+                    out.write(struct.pack('<4s5H3I2H', b'PK\x03\x04', 20, 0x800, 8, clock, date,
+                                          crc, len(data), size, len(name), 0))
+                    out.write(name)
+                    out.write(data)
+                    record = struct.pack('<4s6H3I5H2I', b'PK\x01\x02', 20, 20, 0x800, 8, clock, date,
+                                         crc, len(data), size, len(name), 0, 0, 0, 0, 0, offset) + name
+                    central_dir.append(record)
+                    cd_size += len(record)
+
+            cd_offset = out.tell()
+            for record in central_dir:
+                out.write(record)
+            out.write(struct.pack('<4s4H2IH', b'PK\x05\x06', 0, 0, len(central_dir), len(central_dir),
+                                  cd_size, cd_offset, 0))
+        return True
 
+    # 大小取自扫描结果，不再逐个 stat；明显超限时直接走 ZIP64，免去一轮白做的并行压缩
+    total_bytes = sum(file_info['size_bytes'] for file_info in pdf_files)
+    if total_bytes >= zipfile.ZIP64_LIMIT or len(pdf_files) >= 0xFFFF or not write_parallel():
+        write_zip64()
 
-def scan_image_files(image_dir):
-    return scan_files(image_dir, ['jpg', 'jpeg', 'png', 'webp'])
 
+def create_pdf_zip(pdf_files, output_path):
+    """
+    将 scan_pdf_files 的扫描结果打包，不再重复扫描目录，调用方需保证 pdf_files 非空。
+    成功返回 ZIP 大小（字节），失败返回 None
+    """
+    import zipfile
 
-def create_pdf_zip(pdf_dir, output_path):
     log(f"开始打包 PDF 文件...")
-    pdf_path = Path(pdf_dir)
-    if not pdf_path.exists() or not list(pdf_path.glob('*.pdf')):
-        log("PDF 目录为空，跳过打包", 'WARNING')
-        return False
     try:
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        zip_base = str(Path(output_path).with_suffix(''))
-        shutil.make_archive(zip_base, 'zip', pdf_dir)
-        zip_size = get_file_size_mb(output_path)
-        log(f"✅ 打包完成: {Path(output_path).name} ({zip_size} MB)")
-        return True
+        if ZIP_COMPRESSION == 'deflate':
+            write_deflate_zip(pdf_files, output_path)
+        else:
+            # PDF 本身已是压缩格式，直接存储即可，避免无意义的 deflate 开销
+            with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for file_info in pdf_files:
+                    zf.write(file_info['path'], arcname=zip_arcname(file_info))
+        zip_bytes = os.path.getsize(output_path)
+        log(f"✅ 打包完成: {os.path.basename(output_path)} ({bytes_to_mb(zip_bytes)} MB)")
+        return zip_bytes
     except Exception as e:
         log(f"打包失败: {e}", 'ERROR')
-        return False
+        return None
 
 
-def build_email_content_pdf(pdf_files, zip_size_mb, is_large_file, zip_name):
-    today = datetime.now().strftime('%Y-%m-%d')
+def build_email_content_pdf(pdf_files, size_mb, is_large_file, zip_name, today):
+    """zip_name 为 None 表示总大小已超限、未打包，size_mb 为 PDF 总大小而非 ZIP 大小"""
     title = EMAIL_TITLE if EMAIL_TITLE else f"禁漫PDF已生成（共 {len(pdf_files)} 本 · {today}）"
-    content = EMAIL_CONTENT + "\n\n" if EMAIL_CONTENT else "✅ 你的禁漫 PDF 文件已准备就绪！\n\n"
+    parts = [EMAIL_CONTENT + "\n\n" if EMAIL_CONTENT else "✅ 你的禁漫 PDF 文件已准备就绪！\n\n"]
 
     if pdf_files:
-        content += f"{'=' * 50}\n"
-        content += f"📚 共 {len(pdf_files)} 本 PDF：\n"
-        content += f"{'=' * 50}\n"
-        for file_info in pdf_files:
-            content += f"  • {file_info['name']} ({file_info['size_mb']} MB)\n"
-        content += f"{'=' * 50}\n\n"
+        parts.append(SEP)
+        parts.append(f"📚 共 {len(pdf_files)} 本 PDF：\n")
+        parts.append(SEP)
+        parts.extend(f"  • {file_info['name']} ({file_info['size_mb']} MB)\n" for file_info in pdf_files)
+        parts.append(SEP + "\n")
 
     if is_large_file:
-        content += f"⚠️ 附件超过 {ATTACH_LIMIT_MB} MB，请前往 GitHub Actions 的 Artifacts 下载\n"
-        content += f"📦 ZIP 大小: {zip_size_mb} MB\n"
+        parts.append(f"⚠️ 附件超过 {ATTACH_LIMIT_MB} MB，请前往 GitHub Actions 的 Artifacts 下载\n")
+        if zip_name is None:
+            parts.append(f"📊 PDF 总大小: {size_mb} MB\n")
+        else:
+            parts.append(f"📦 ZIP 大小: {size_mb} MB\n")
     else:
-        content += f"📦 附件已打包为 {zip_name} ({zip_size_mb} MB)\n"
+        parts.append(f"📦 附件已打包为 {zip_name} ({size_mb} MB)\n")
 
-    content += "\n—— GitHub Actions 自动服务"
-    return title, content
+    parts.append("\n—— GitHub Actions 自动服务")
+    return title, ''.join(parts)
 
 
-def get_album_info(image_dir):
-    """获取原图模式本子名称和图片数量（取二级目录名，与 PDF 命名一致）"""
-    base_path = Path(image_dir)
-    if not base_path.exists():
-        log(f"目录不存在: {image_dir}", 'WARNING')
-        return []
+def scan_album(album_dir):
+    """递归扫描单个本子目录，返回图片文件名列表；原图模式只需数量与格式，不对文件做 stat"""
+    return [entry.name for entry in iter_files(album_dir, IMAGE_EXTENSIONS)]
 
-    album_info = []
-    for first_level in base_path.iterdir():
-        if first_level.is_dir():
-            for second_level in first_level.iterdir():
-                if second_level.is_dir():
-                    img_count = len(list(second_level.glob('**/*.webp'))) + \
-                                len(list(second_level.glob('**/*.jpg'))) + \
-                                len(list(second_level.glob('**/*.jpeg'))) + \
-                                len(list(second_level.glob('**/*.png')))
-                    album_info.append({'name': second_level.name, 'count': img_count})
 
-    return sorted(album_info, key=lambda x: x['name'])
+def scan_image_tree(image_dir):
+    """
+    单次遍历原图下载目录，同时得到图片文件名与本子信息（取二级目录名，与 PDF 命名一致），
+    返回 (图片文件名列表, 本子信息列表)
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
+    try:
+        first_level_entries = os.scandir(image_dir)
+    except (FileNotFoundError, NotADirectoryError):
+        log(f"目录不存在: {image_dir}", 'WARNING')
+        return [], []
+    except OSError as e:
+        # 与 iter_files 一致，根目录无法读取时按空结果处理，仍发送通知邮件
+        log(f"⚠️ 无法读取目录，已跳过: {image_dir} ({e})", 'WARNING')
+        return [], []
+
+    image_names = []
+    album_dirs = []
+    # 前两级只需列出目录，代价很小，在主线程完成；各本子（二级目录）的递归遍历再交给线程池
+    with first_level_entries:
+        for first_level in first_level_entries:
+            if first_level.is_symlink():
+                continue
+            if not first_level.is_dir(follow_symlinks=False):
+                if ext_matches(first_level.name, IMAGE_EXTENSIONS):
+                    image_names.append(first_level.name)
+                continue
+            try:
+                second_level_entries = os.scandir(first_level.path)
+            except OSError as e:
+                log(f"⚠️ 无法读取目录，已跳过: {first_level.path} ({e})", 'WARNING')
+                continue
+            with second_level_entries:
+                for second_level in second_level_entries:
+                    if second_level.is_symlink():
+                        continue
+                    if second_level.is_dir(follow_symlinks=False):
+                        album_dirs.append(second_level)
+                    elif ext_matches(second_level.name, IMAGE_EXTENSIONS):
+                        image_names.append(second_level.name)
 
-def build_email_content_images(image_dir, archive_size_mb, is_large_file, archive_name):
-    today = datetime.now().strftime('%Y-%m-%d')
+    album_info = []
+    if album_dirs:
+        # 本子之间互不相关，目录读取会释放 GIL，按本子粒度并行，单个一级目录下本子很多时也能分摊
+        with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(album_dirs))) as executor:
+            results = executor.map(scan_album, [album_dir.path for album_dir in album_dirs])
+            for album_dir, album_names in zip(album_dirs, results):
+                image_names.extend(album_names)
+                album_info.append({
+                    'name': album_dir.name,
+                    'count': len(album_names)
+                })
+    album_info.sort(key=lambda x: x['name'])
+    return image_names, album_info
+
+
+def build_email_content_images(album_info, archive_size_mb, is_large_file, archive_name, today):
     title = EMAIL_TITLE if EMAIL_TITLE else f"禁漫原图已下载（{today}）"
-    content = EMAIL_CONTENT + "\n\n" if EMAIL_CONTENT else "✅ 你的禁漫原图文件已准备就绪！\n\n"
+    parts = [EMAIL_CONTENT + "\n\n" if EMAIL_CONTENT else "✅ 你的禁漫原图文件已准备就绪！\n\n"]
 
-    album_info = get_album_info(image_dir)
     if album_info:
-        content += f"{'=' * 50}\n"
-        content += f"🖼️ 本子列表（原图模式）：\n"
-        content += f"{'=' * 50}\n"
-        for album in album_info:
-            content += f"  • {album['name']} （{album['count']} 张图片）\n"
-        content += f"{'=' * 50}\n\n"
+        parts.append(SEP)
+        parts.append(f"🖼️ 本子列表（原图模式）：\n")
+        parts.append(SEP)
+        parts.extend(f"  • {album['name']} （{album['count']} 张图片）\n" for album in album_info)
+        parts.append(SEP + "\n")
 
     if is_large_file:
-        content += f"⚠️ 压缩包超过 {ATTACH_LIMIT_MB} MB，请前往 GitHub Actions 的 Artifacts（https://github.com/myslice666/JMComic-Crawler-Python/actions/workflows/download_dispatch.yml） 下载\n"
-        content += f"📦 压缩包: {archive_name} ({archive_size_mb} MB)\n"
+        parts.append(f"⚠️ 压缩包超过 {ATTACH_LIMIT_MB} MB，请前往 GitHub Actions 的 Artifacts（https://github.com/myslice666/JMComic-Crawler-Python/actions/workflows/download_dispatch.yml） 下载\n")
+        parts.append(f"📦 压缩包: {archive_name} ({archive_size_mb} MB)\n")
     else:
-        content += f"📦 附件已打包为 {archive_name} ({archive_size_mb} MB)\n"
-
-    content += "\n—— GitHub Actions 自动服务"
-    return title, content
+        parts.append(f"📦 附件已打包为 {archive_name} ({archive_size_mb} MB)\n")
+
+    parts.append("\n—— GitHub Actions 自动服务")
+    return title, ''.join(parts)
+
+
+def build_attachment(attachment_path, attach_name):
+    """分块进行 base64 编码，避免原始文件与编码结果同时完整驻留内存"""
+    import base64
+    import mmap
+    from email import encoders
+    from email.mime.application import MIMEApplication
+
+    encoded_chunks = []
+    with open(attachment_path, 'rb') as f:
+        # 通过 mmap 按需映射文件页，分块切片直接编码，不再为每块 read 出一份 bytes 拷贝
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    for offset in range(0, len(view), ATTACH_CHUNK_SIZE):
+                        chunk = view[offset:offset + ATTACH_CHUNK_SIZE]
+                        encoded_chunks.append(base64.encodebytes(chunk).decode('ascii'))
+                        chunk.release()
+
+    attachment = MIMEApplication(b'', _encoder=encoders.encode_noop)
+    attachment.set_payload(''.join(encoded_chunks))
+    attachment['Content-Transfer-Encoding'] = 'base64'
+    attachment.add_header(
+        'Content-Disposition',
+        'attachment',
+        filename=('utf-8', '', attach_name)
+    )
+    return attachment
+
+
+def get_smtp():
+    """获取本次运行复用的 SMTP 连接，首次调用时建立连接并登录"""
+    global _smtp_conn
+    import smtplib
+
+    if _smtp_conn is None:
+        log("正在连接 SMTP 服务器...")
+        smtp_conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=60)
+        try:
+            smtp_conn.login(EMAIL_FROM, EMAIL_PASS)
+        except:
+            smtp_conn.close()
+            raise
+        log("✅ SMTP 登录成功")
+        _smtp_conn = smtp_conn
+    return _smtp_conn
 
 
-def send_email(title, content, attachment_path=None, retry_count=0):
-    smtp_conn = None
+def close_smtp():
+    global _smtp_conn
+    if _smtp_conn is None:
+        return
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_FROM
-        msg['To'] = EMAIL_TO
-        msg['Subject'] = title
-        msg.attach(MIMEText(content, 'plain', 'utf-8'))
-
-        if attachment_path and os.path.exists(attachment_path):
-            attach_size_mb = get_file_size_mb(attachment_path)
-            attach_name = Path(attachment_path).name
-            if attach_size_mb <= ATTACH_LIMIT_MB:
-                log(f"添加附件: {attach_name} ({attach_size_mb} MB)")
-                with open(attachment_path, 'rb') as f:
-                    attachment = MIMEApplication(f.read())
-                    attachment.add_header(
-                        'Content-Disposition',
-                        'attachment',
-                        filename=('utf-8', '', attach_name)
-                    )
-                    msg.attach(attachment)
+        _smtp_conn.quit()
+    except:
+        _smtp_conn.close()
+    _smtp_conn = None
+
+
+def is_permanent_smtp_error(e):
+    """
+    5xx 为永久性错误，重试无意义；4xx（如 421/450/451/452）为临时错误，可以重试。
+    收件人全部被拒（SMTPRecipientsRefused）时，只有每个收件人的应答都是 5xx 才算永久性错误
+    """
+    recipients = getattr(e, 'recipients', None)
+    if recipients:
+        return all(isinstance(code, int) and 500 <= code < 600 for code, _ in recipients.values())
+    code = getattr(e, 'smtp_code', None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def sendmail_data(smtp_conn, recipients, data):
+    """
+    与 smtp_conn.sendmail 行为一致，但 data 须为已使用 CRLF 换行的报文：
+    按行首 '.' 位置切片后直接写入 socket（点填充），不再像 smtplib.data() 那样整体复制多份报文
+    """
+    import smtplib
+
+    def abort_transaction(code):
+        # 与 sendmail 一致：421 表示服务器即将断开，直接关闭；其余情况 RSET 结束未完成的事务，
+        # 避免复用的连接停在 MAIL 之后，下一封邮件收到 503 nested MAIL
+        if code == 421:
+            smtp_conn.close()
+            return
+        try:
+            smtp_conn.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
 
-        log("正在连接 SMTP 服务器...")
-        smtp_conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=60)
-        smtp_conn.login(EMAIL_FROM, EMAIL_PASS)
-        log("✅ SMTP 登录成功")
-        smtp_conn.send_message(msg)
-        log("✅ 邮件发送成功")
+    smtp_conn.ehlo_or_helo_if_needed()
+    code, resp = smtp_conn.mail(EMAIL_FROM)
+    if code != 250:
+        abort_transaction(code)
+        raise smtplib.SMTPSenderRefused(code, resp, EMAIL_FROM)
+    refused = {}
+    for addr in recipients:
+        code, resp = smtp_conn.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+    if len(refused) == len(recipients):
+        abort_transaction(0)
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    smtp_conn.putcmd('data')
+    code, resp = smtp_conn.getreply()
+    if code != 354:
+        abort_transaction(code)
+        raise smtplib.SMTPDataError(code, resp)
+
+    sock = smtp_conn.sock
+    if sock is None:
+        # 与 smtplib.send 一致，交给 send_email 按断线处理（立即重连重试）
+        raise smtplib.SMTPServerDisconnected('please run connect() first')
+    with memoryview(data) as view:
+        if data.startswith(b'.'):
+            sock.sendall(b'.')
+        start = 0
+        # 行首的 '.' 需再补一个 '.'，只有这些位置需要分段，其余部分按切片原样发送
+        pos = data.find(b'\r\n.')
+        while pos != -1:
+            sock.sendall(view[start:pos + 2])
+            sock.sendall(b'.')
+            start = pos + 2
+            pos = data.find(b'\r\n.', start)
+        sock.sendall(view[start:])
+    sock.sendall(b'.\r\n' if data.endswith(b'\r\n') else b'\r\n.\r\n')
+
+    code, resp = smtp_conn.getreply()
+    if code != 250:
+        abort_transaction(code)
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def build_message(title, content, attachment_path=None, attachment_size_bytes=None):
+    """构建邮件并序列化为 bytes，重试时直接复用，不必重新读取与编码附件"""
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    from email.generator import BytesGenerator
+    from email.policy import compat32
+    from io import BytesIO
+
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_FROM
+    msg['To'] = EMAIL_TO
+    msg['Subject'] = title
+    msg.attach(MIMEText(content, 'plain', 'utf-8'))
+
+    if attachment_path and attachment_size_bytes is not None and attachment_size_bytes <= ATTACH_LIMIT_BYTES:
+        attach_name = os.path.basename(attachment_path)
+        log(f"添加附件: {attach_name} ({bytes_to_mb(attachment_size_bytes)} MB)")
+        msg.attach(build_attachment(attachment_path, attach_name))
+
+    # 一次性序列化为 bytes 后直接发送，省去 send_message 内部重新解析地址与头部；
+    # 直接按 SMTP 要求的 CRLF 换行生成，发送时无需再整体转换换行符
+    buf = BytesIO()
+    BytesGenerator(buf, mangle_from_=False, policy=compat32.clone(linesep='\r\n')).flatten(msg)
+    # 返回后 MIME 树（含 base64 编码后的附件）即被释放，发送期间只保留一份完整报文
+    return buf.getvalue()
+
+
+def send_email(title, content, attachment_path=None, attachment_size_bytes=None):
+    """attachment_size_bytes 由调用方传入已知的附件字节数，避免重复 stat"""
+    import random
+    import smtplib
+    from concurrent.futures import ThreadPoolExecutor
+
+    recipients = [addr.strip() for addr in EMAIL_TO.split(',') if addr.strip()]
+
+    if attachment_path and attachment_size_bytes is None:
         try:
-            smtp_conn.quit()
-        except:
+            attachment_size_bytes = os.path.getsize(attachment_path)
+        except FileNotFoundError:
             pass
-        return True
-    except smtplib.SMTPAuthenticationError:
-        log("❌ SMTP 认证失败，请检查邮箱授权码", 'ERROR')
-        return False
-    except Exception as e:
-        log(f"❌ 邮件发送失败: {e}", 'ERROR')
-        if smtp_conn:
-            try:
-                smtp_conn.quit()
-            except:
-                pass
-        if retry_count < MAX_RETRIES:
-            retry_count += 1
-            log(f"🔄 {RETRY_DELAY} 秒后进行第 {retry_count} 次重试...", 'WARNING')
-            time.sleep(RETRY_DELAY)
-            return send_email(title, content, attachment_path, retry_count)
-        else:
-            log(f"❌ 已达到最大重试次数 ({MAX_RETRIES})，发送失败", 'ERROR')
+
+    # TLS 握手与登录（等待网络）和附件读取、编码（磁盘与 CPU）互不依赖，连接放到后台线程同时进行
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        smtp_future = executor.submit(get_smtp)
+        try:
+            data = build_message(title, content, attachment_path, attachment_size_bytes)
+        except Exception as e:
+            log(f"❌ 邮件构建失败: {e}", 'ERROR')
+            return False
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            # 首次连接的异常在此重新抛出，与后续重试走同一套处理
+            smtp_conn = smtp_future.result() if attempt == 0 else get_smtp()
+            sendmail_data(smtp_conn, recipients, data)
+            log("✅ 邮件发送成功")
+            return True
+        except smtplib.SMTPAuthenticationError:
+            log("❌ SMTP 认证失败，请检查邮箱授权码", 'ERROR')
             return False
+        except smtplib.SMTPServerDisconnected as e:
+            # 通常是空闲超时被服务器断开，与服务器负载无关，立即重连重试即可，无需退避
+            log(f"⚠️ SMTP 连接已断开: {e}", 'WARNING')
+            close_smtp()
+            if attempt < MAX_RETRIES:
+                log(f"🔄 重新连接并进行第 {attempt + 1} 次重试...", 'WARNING')
+        except Exception as e:
+            if isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+                # 与其他应答一样按应答码区分：5xx 不再重试，4xx（如 451 稍后再试）照常重试
+                log(f"❌ 发件人或收件人被服务器拒绝: {e}", 'ERROR')
+            else:
+                log(f"❌ 邮件发送失败: {e}", 'ERROR')
+            if is_permanent_smtp_error(e):
+                close_smtp()
+                log("❌ 服务器返回永久性错误 (5xx)，不再重试", 'ERROR')
+                return False
+            if isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                # 服务器已正常应答（4xx），sendmail_data 已发送 RSET 清理事务，连接可直接复用；
+                # 只有 421 等导致连接被关闭时才丢弃，由下次重试重新建立
+                if _smtp_conn is not None and _smtp_conn.sock is None:
+                    close_smtp()
+            else:
+                # 网络异常等，连接状态未知，丢弃后由下次重试重新建立
+                close_smtp()
+            if attempt < MAX_RETRIES:
+                # 指数退避 + 随机抖动，避免重试时刻与故障周期同步
+                delay = min(RETRY_MAX_DELAY, RETRY_DELAY * (2 ** attempt) * (1 + random.random() * RETRY_JITTER))
+                log(f"🔄 {delay:.1f} 秒后进行第 {attempt + 1} 次重试...", 'WARNING')
+                time.sleep(delay)
+
+    log(f"❌ 已达到最大重试次数 ({MAX_RETRIES})，发送失败", 'ERROR')
+    return False
 
 
 def handle_pdf_mode():
     log("📄 当前模式: PDF 模式")
-    pdf_dir = Path(JM_DOWNLOAD_DIR) / 'pdf'
-    log(f"📁 扫描 PDF 目录: {pdf_dir}")
-    pdf_files = scan_pdf_files(pdf_dir)
+    log(f"📁 扫描 PDF 目录: {PDF_DIR}")
+    pdf_files, total_bytes = scan_pdf_files(PDF_DIR)
 
     if not pdf_files:
         log("⚠️ 未找到 PDF 文件", 'WARNING')
         return None, None, None, []
 
     log(f"✅ 找到 {len(pdf_files)} 个 PDF 文件:")
-    total_size = 0
-    for file_info in pdf_files:
-        log(f"  • {file_info['name']} ({file_info['size_mb']} MB)")
-        total_size += file_info['size_mb']
-    log(f"📊 总大小: {total_size:.1f} MB")
-
-    zip_name = 'all_pdf.zip'
-    zip_path = Path(JM_DOWNLOAD_DIR) / zip_name
-    if not create_pdf_zip(pdf_dir, zip_path):
+    log_lines(f"  • {file_info['name']} ({file_info['size_mb']} MB)" for file_info in pdf_files)
+    log(f"📊 总大小: {bytes_to_mb(total_bytes)} MB")
+
+    # 以 ZIP_STORED 打包不会变小，总大小已超限时打包结果必然超限，直接跳过打包
+    if ZIP_COMPRESSION != 'deflate' and total_bytes > ATTACH_LIMIT_BYTES:
+        log(f"⚠️ PDF 总大小超过附件限制 ({bytes_to_mb(total_bytes)} MB > {ATTACH_LIMIT_MB} MB)，跳过打包", 'WARNING')
+        log("将发送通知邮件（不带附件）")
+        # 未生成 ZIP，不返回压缩包路径，大小为 PDF 总大小
+        return None, total_bytes, True, pdf_files
+
+    zip_bytes = create_pdf_zip(pdf_files, PDF_ZIP_PATH)
+    if zip_bytes is None:
         log("❌ 打包失败", 'ERROR')
         return None, None, None, pdf_files
 
-    zip_size_mb = get_file_size_mb(zip_path)
-    is_large_file = zip_size_mb > ATTACH_LIMIT_MB
+    is_large_file = zip_bytes > ATTACH_LIMIT_BYTES
     if is_large_file:
-        log(f"⚠️ ZIP 文件过大 ({zip_size_mb} MB > {ATTACH_LIMIT_MB} MB)", 'WARNING')
+        log(f"⚠️ ZIP 文件过大 ({bytes_to_mb(zip_bytes)} MB > {ATTACH_LIMIT_MB} MB)", 'WARNING')
         log("将发送通知邮件（不带附件）")
 
-    return zip_path, zip_size_mb, is_large_file, pdf_files
+    return PDF_ZIP_PATH, zip_bytes, is_large_file, pdf_files
 
 
 def handle_images_mode():
     log("🖼️  当前模式: 原图模式")
-    archive_path = Path(JM_DOWNLOAD_DIR) / ZIP_NAME
-    if not archive_path.exists():
+    # 直接取大小，文件不存在时由异常判断，省去一次单独的存在性检查
+    try:
+        archive_bytes = os.path.getsize(ARCHIVE_PATH)
+    except FileNotFoundError:
         log(f"⚠️ 未找到压缩包: {ZIP_NAME}", 'WARNING')
         return None, None, None, []
 
-    image_files = scan_image_files(JM_DOWNLOAD_DIR)
-    if not image_files:
+    # 图片列表与本子信息在同一次遍历中得到，正文构建时不再重新遍历下载目录
+    image_names, album_info = scan_image_tree(JM_DOWNLOAD_DIR)
+    if not image_names:
         log("⚠️ 未找到图片文件", 'WARNING')
     else:
-        log(f"✅ 找到 {len(image_files)} 张图片")
-        formats = {}
-        for img in image_files:
-            ext = Path(img['name']).suffix.lower()
-            formats[ext] = formats.get(ext, 0) + 1
-        for ext, count in sorted(formats.items()):
-            log(f"  • {ext.upper()}: {count} 张")
-
-    archive_size_mb = get_file_size_mb(archive_path)
-    is_large_file = archive_size_mb > ATTACH_LIMIT_MB
+        log(f"✅ 找到 {len(image_names)} 张图片")
+        # scan_image_tree 保证文件名带扩展名，直接做字符串切分，不构造 Path
+        formats = Counter(name.rpartition('.')[2].lower() for name in image_names)
+        log_lines(f"  • {ext.upper()}: {count} 张" for ext, count in sorted(formats.items()))
+
+    archive_size_mb = bytes_to_mb(archive_bytes)
+    is_large_file = archive_bytes > ATTACH_LIMIT_BYTES
     log(f"📦 压缩包: {ZIP_NAME} ({archive_size_mb} MB)")
     if is_large_file:
         log(f"⚠️ 压缩包过大 ({archive_size_mb} MB > {ATTACH_LIMIT_MB} MB)", 'WARNING')
         log("将发送通知邮件（不带附件）")
 
-    return archive_path, archive_size_mb, is_large_file, image_files
+    return ARCHIVE_PATH, archive_bytes, is_large_file, album_info
 
 
 def main():
@@ -292,29 +645,31 @@ def main():
     log(f"📥 收件人: {EMAIL_TO}")
     log(f"📦 输出模式: {OUTPUT_FORMAT}")
 
+    today = time.strftime('%Y-%m-%d')
+
     if OUTPUT_FORMAT == 'images_only':
-        attachment_path, size_mb, is_large, files = handle_images_mode()
+        attachment_path, size_bytes, is_large, album_info = handle_images_mode()
         if attachment_path is None:
-            title = f"禁漫下载任务完成 · {datetime.now().strftime('%Y-%m-%d')}"
+            title = f"禁漫下载任务完成 · {today}"
             content = "下载任务已完成，但未找到压缩包文件。\n\n—— GitHub Actions 自动服务"
             send_email(title, content)
             return 0
-        title, content = build_email_content_images(JM_DOWNLOAD_DIR, size_mb, is_large, ZIP_NAME)
+        title, content = build_email_content_images(album_info, bytes_to_mb(size_bytes), is_large, ZIP_NAME, today)
     else:  # pdf_only
-        attachment_path, size_mb, is_large, files = handle_pdf_mode()
-        if attachment_path is None:
-            title = f"禁漫下载任务完成 · {datetime.now().strftime('%Y-%m-%d')}"
+        attachment_path, size_bytes, is_large, files = handle_pdf_mode()
+        if size_bytes is None:
+            title = f"禁漫下载任务完成 · {today}"
             content = "下载任务已完成，但未生成 PDF 文件或打包失败。\n\n—— GitHub Actions 自动服务"
             send_email(title, content)
             return 0
-        zip_name = Path(attachment_path).name
-        title, content = build_email_content_pdf(files, size_mb, is_large, zip_name)
+        zip_name = PDF_ZIP_NAME if attachment_path else None
+        title, content = build_email_content_pdf(files, bytes_to_mb(size_bytes), is_large, zip_name, today)
 
     log("=" * 60)
     if is_large:
         success = send_email(title, content)
     else:
-        success = send_email(title, content, attachment_path)
+        success = send_email(title, content, attachment_path, attachment_size_bytes=size_bytes)
     log("=" * 60)
 
     if success:
@@ -337,3 +692,5 @@ if __name__ == '__main__':
         import traceback
         log(traceback.format_exc(), 'ERROR')
         sys.exit(0)
+    finally:
+        close_smtp()